@@ -8,21 +8,32 @@ Includes:
 - OpenAI integration
 - Environment config
 """
-from fastapi import FastAPI, HTTPException, File, UploadFile
-from fastapi.responses import StreamingResponse, HTMLResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse, HTMLResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-from openai import OpenAI
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder, IdentityResponder
+from pydantic import BaseModel, ConfigDict, Field
+from openai import AsyncOpenAI
+import httpx
 import os
 import asyncio
+import time
+import weakref
 import logging
-import json
-from typing import Optional, List, Dict
+import orjson
+import gzip
+import xxhash
+from typing import Optional, List, Dict, Deque, NamedTuple
+from functools import lru_cache
 from datetime import datetime, timezone
-from collections import defaultdict
+from collections import deque
+from itertools import islice
 from pathlib import Path
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+from aiolimiter import AsyncLimiter
+from cachetools import TTLCache
 
 # ----------------------------------------------------------------------
 # Load .env
@@ -31,6 +42,7 @@ load_dotenv()
 
 # Import resources router
 from .resources import router as resources_router
+from .semantic_cache import SemanticCache
 
 # ----------------------------------------------------------------------
 # Logging
@@ -52,16 +64,105 @@ if not OPENAI_API_KEY:
     logger.error(error)
     raise RuntimeError("OPENAI_API_KEY is required")
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Explicitly sized connection pool shared by every OpenAI call, so bursts
+# reuse warm keep-alive connections instead of hitting httpx.PoolTimeout.
+# HTTP/2 lets concurrent calls multiplex over one TLS connection.
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=int(os.getenv("OPENAI_MAX_CONN", "1024")),
+        max_keepalive_connections=int(os.getenv("OPENAI_KEEPALIVE", "512")),
+        keepalive_expiry=30.0,
+    ),
+    timeout=httpx.Timeout(connect=5.0, read=120.0, write=30.0, pool=5.0),
+    http2=os.getenv("OPENAI_HTTP2", "true").lower() == "true",
+)
+client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
 
 DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
 DEFAULT_MAX_TOKENS = int(os.getenv("OPENAI_MAX_TOKENS", "1000"))
 DEFAULT_TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "0.7"))
 DEFAULT_CONTEXT_WINDOW = int(os.getenv("DEFAULT_CONTEXT_WINDOW", "10"))
 MAX_HISTORY_PER_SESSION = int(os.getenv("MAX_HISTORY_PER_SESSION", "20"))
-
-# In-memory conversation history
-conversation_history: Dict[str, List[Dict]] = defaultdict(list)
+# Upper bounds enforced on ChatRequest
+MAX_TOKENS_LIMIT = 2000
+MAX_CONTEXT_WINDOW = 50
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "64"))
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "3000"))
+OPENAI_QUEUE_TIMEOUT = float(os.getenv("OPENAI_QUEUE_TIMEOUT", "30"))
+SESSION_CACHE_MAX = int(os.getenv("SESSION_CACHE_MAX", "10000"))
+SESSION_TTL = int(os.getenv("SESSION_TTL", "3600"))
+REDIS_URL = os.getenv("REDIS_URL")
+RESPONSE_CACHE_MAX = int(os.getenv("RESPONSE_CACHE_MAX", "4096"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE", "false").lower() == "true"
+SEMCACHE_THRESHOLD = float(os.getenv("SEMCACHE_THRESHOLD", "0.08"))
+SEMCACHE_EMBED_MODEL = os.getenv("SEMCACHE_EMBED_MODEL", "text-embedding-3-small")
+# Replies sampled above this temperature are too random to be worth reusing
+SEMCACHE_MAX_TEMPERATURE = 0.3
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant."
+
+# Streamed deltas are coalesced into SSE frames: the first token is sent alone,
+# then each frame may hold STREAM_BATCH_GROWTH times more deltas (up to
+# STREAM_BATCH_SIZE), and a held delta is flushed once STREAM_FLUSH_MS has
+# passed since the previous frame, even if no further delta arrives
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "50"))
+STREAM_BATCH_GROWTH = float(os.getenv("STREAM_BATCH_GROWTH", "3"))
+STREAM_FLUSH_MS = float(os.getenv("STREAM_FLUSH_MS", "40"))
+
+# Constant SSE frames, encoded once
+_SSE_DONE = b'data: {"done": true}\n\n'
+_SSE_ERROR = b'data: {"error": "Stream failed"}\n\n'
+# Keep proxies (nginx, CDNs) from caching or buffering the event stream
+_SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+class OpenAILimits(NamedTuple):
+    """Caps in-flight OpenAI calls so bursts queue here instead of tripping 429s,
+    and paces call starts to the account's requests-per-minute budget."""
+    sem: asyncio.Semaphore
+    rate: AsyncLimiter
+
+
+# Both primitives bind to the event loop that first uses them, so each running
+# loop gets its own pair; entries go away with their loop
+_openai_limits: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+# In-memory conversation history. Each session keeps OpenAI-ready
+# {"role", "content"} dicts and their epoch-nanosecond timestamps in parallel
+# bounded deques, so the chat path forwards stored messages as-is and old
+# turns fall off in O(1).
+# The session count is bounded too: idle sessions expire after SESSION_TTL and
+# the least recently used are evicted past SESSION_CACHE_MAX.
+conversation_history: TTLCache = TTLCache(maxsize=SESSION_CACHE_MAX, ttl=SESSION_TTL)
+
+# Exact-match replies for deterministic (temperature 0) requests, keyed by a
+# digest of the full OpenAI payload (used when Redis is not configured)
+response_cache: TTLCache = TTLCache(maxsize=RESPONSE_CACHE_MAX, ttl=RESPONSE_CACHE_TTL)
+
+# Completions currently running for a response-cache key, so concurrent
+# identical requests share one upstream call
+_inflight: Dict[str, asyncio.Task] = {}
+
+# Opt-in semantic cache: near-duplicate conversations reuse a stored reply
+# instead of paying for another completion
+semantic_cache = (
+    SemanticCache(
+        threshold=SEMCACHE_THRESHOLD,
+        max_entries=int(os.getenv("SEMCACHE_MAX_ENTRIES", "1000")),
+        ttl=float(os.getenv("SEMCACHE_TTL", "3600")),
+    )
+    if SEMANTIC_CACHE_ENABLED
+    else None
+)
+
+# Optional shared store: with REDIS_URL set, history and cached replies live
+# in Redis so they survive restarts and are shared across workers and replicas.
+if REDIS_URL:
+    import redis.asyncio as aioredis
+
+    redis_client = aioredis.from_url(REDIS_URL)
+else:
+    redis_client = None
 
 # ----------------------------------------------------------------------
 # FastAPI App + Lifespan
@@ -76,13 +177,81 @@ async def lifespan(app: FastAPI):
     • API Root: http://localhost:8000/
     • Docs: http://localhost:8000/docs
     """
-    print(welcome)
-    logger.info("Server started")
+    logger.info(welcome)
     yield
     logger.info("Server shutting down")
+    await http_client.aclose()
+    if redis_client is not None:
+        await redis_client.aclose()
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson (FastAPI's own ORJSONResponse is deprecated)."""
 
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
 
-app = FastAPI(lifespan=lifespan)
+
+class OpenAIStreamingResponse(StreamingResponse):
+    """Streams a body that was given an OpenAI slot before the response started.
+
+    The slot is released however the response ends, including when the client
+    goes away before the first frame and the body never runs.
+    """
+
+    def __init__(self, content, slot: asyncio.Semaphore, **kwargs):
+        super().__init__(content, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                await self.body_iterator.aclose()
+            finally:
+                self.slot.release()
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip, honouring q-values (``gzip;q=0`` refuses it)."""
+    wildcard = False
+    for entry in accept_encoding.split(","):
+        coding, _, params = entry.partition(";")
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding in ("gzip", "x-gzip"):
+            return q > 0
+        if coding == "*":
+            wildcard = q > 0
+    return wildcard
+
+
+class QValueGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that honours Accept-Encoding q-values instead of matching "gzip" anywhere."""
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        # Same decision as _page_response, so JSON and pages agree for every header
+        if _accepts_gzip(Headers(scope=scope).get("accept-encoding", "")):
+            responder = GZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size)
+        await responder(scope, receive, send)
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+# Compresses larger JSON replies; text/event-stream and already-encoded pages pass through untouched
+app.add_middleware(QValueGZipMiddleware, minimum_size=512, compresslevel=6)
 
 # ----------------------------------------------------------------------
 # Static files & Routers
@@ -94,193 +263,448 @@ if static_path.exists():
 # Resources router (for /api/resources/* etc.)
 app.include_router(resources_router)
 
+# Static HTML pages are read once at import and served from memory
+pages_path = Path(__file__).parent.parent / "pages"
+
+
+# Pages only change on deploy, so let browsers and CDNs reuse them briefly
+_PAGE_HEADERS = {"Cache-Control": "public, max-age=300", "Vary": "Accept-Encoding"}
+
+
+class _Page(NamedTuple):
+    body: bytes
+    gzipped: bytes
+    headers: Dict[str, str]
+    gzip_headers: Dict[str, str]
+
+
+def _read_page(name: str) -> Optional[_Page]:
+    """Read a page once, precomputing its gzip body and ETag-bearing headers."""
+    path = pages_path / name
+    if not path.exists():
+        return None
+    body = path.read_bytes()
+    digest = xxhash.xxh3_64_hexdigest(body)
+    # Each encoding is its own representation, so each gets its own strong ETag
+    headers = {**_PAGE_HEADERS, "ETag": f'"{digest}"'}
+    gzip_headers = {**_PAGE_HEADERS, "ETag": f'"{digest}-gz"', "Content-Encoding": "gzip"}
+    # mtime=0 keeps the gzip bytes identical across workers and restarts, as the strong ETag promises
+    return _Page(body, gzip.compress(body, 6, mtime=0), headers, gzip_headers)
+
+
+_PLAYGROUND_HTML = _read_page("playground.html")
+_DEMO_HTML = _read_page("demo.html")
+_RESOURCES_HTML = _read_page("resources.html")
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header matches ``etag`` under the weak comparison it calls for.
+
+    Handles ``*``, comma-separated lists and ``W/``-prefixed tags.
+    """
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip() in (etag, "W/" + etag) for tag in if_none_match.split(","))
+
+
+def _page_response(request: Request, page: _Page) -> Response:
+    if _accepts_gzip(request.headers.get("accept-encoding", "")):
+        body, headers = page.gzipped, page.gzip_headers
+    else:
+        body, headers = page.body, page.headers
+    # Revalidation from a warm browser cache costs headers only
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers={**_PAGE_HEADERS, "ETag": headers["ETag"]})
+    return HTMLResponse(body, headers=headers)
+
+
 # ----------------------------------------------------------------------
 # Helpers
 # ----------------------------------------------------------------------
-def trim_history(session_id: str):
-    if len(conversation_history[session_id]) > MAX_HISTORY_PER_SESSION:
-        conversation_history[session_id] = conversation_history[session_id][-MAX_HISTORY_PER_SESSION:]
+def openai_limits() -> OpenAILimits:
+    """Return the OpenAI concurrency and rate limits for the running event loop."""
+    loop = asyncio.get_running_loop()
+    limits = _openai_limits.get(loop)
+    if limits is None:
+        limits = _openai_limits[loop] = OpenAILimits(
+            asyncio.Semaphore(OPENAI_CONCURRENCY), AsyncLimiter(OPENAI_RPM, 60)
+        )
+    return limits
+
+
+async def acquire_openai_slot() -> asyncio.Semaphore:
+    """Take a concurrency slot and a rate-limit token, or answer 429 if none frees up in time.
+
+    Returns the semaphore the caller must release once its OpenAI call is done.
+    """
+    sem, rate = openai_limits()
+    try:
+        await asyncio.wait_for(sem.acquire(), timeout=OPENAI_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=429,
+            detail="AI service is busy, please retry shortly",
+            headers={"Retry-After": str(int(OPENAI_QUEUE_TIMEOUT))},
+        )
+    try:
+        await rate.acquire()
+    except BaseException:
+        sem.release()
+        raise
+    return sem
+
+
+@asynccontextmanager
+async def openai_slot():
+    """Hold a concurrency slot and a rate-limit token for one OpenAI call."""
+    slot = await acquire_openai_slot()
+    try:
+        yield
+    finally:
+        slot.release()
+
+
+def _history_keys(session_id: str):
+    key = f"chat:{session_id}"
+    return key, f"{key}:ts"
+
+
+def get_session_history(session_id: str) -> Dict[str, Deque]:
+    history = conversation_history.get(session_id)
+    if history is None:
+        history = conversation_history[session_id] = {
+            "messages": deque(maxlen=MAX_HISTORY_PER_SESSION),
+            "timestamps": deque(maxlen=MAX_HISTORY_PER_SESSION),
+        }
+    return history
+
+
+@lru_cache(maxsize=128)
+def _system_msg(text: str) -> Dict[str, str]:
+    # Shared across requests; the OpenAI SDK never mutates the messages it is given
+    return {"role": "system", "content": text}
+
+
+def build_openai_kwargs(model, messages, max_tokens, temperature, **opts) -> Dict:
+    """Assemble chat.completions.create kwargs, dropping unset optional params."""
+    kwargs = {"model": model, "messages": messages, "max_tokens": max_tokens, "temperature": temperature}
+    for key, value in opts.items():
+        if value is not None:
+            kwargs[key] = value
+    return kwargs
+
+
+def response_cache_key(kwargs: Dict) -> str:
+    """Digest of a chat.completions.create payload for the exact-match cache."""
+    # Non-cryptographic but 128-bit, so collisions stay negligible even in a shared Redis cache
+    return xxhash.xxh3_128_hexdigest(orjson.dumps(kwargs, option=orjson.OPT_SORT_KEYS))
+
+
+def semantic_cache_scope(kwargs: Dict) -> str:
+    """Semantic-cache partition for a payload: every request parameter plus the system prompt.
+
+    Only the conversation itself is left to embedding similarity, so a reply is
+    never reused for a request with a different model, length limit or sampling.
+    """
+    params = {key: value for key, value in kwargs.items() if key != "messages"}
+    return orjson.dumps(params, option=orjson.OPT_SORT_KEYS).decode() + "\n" + kwargs["messages"][0]["content"]
+
+
+async def _complete(kwargs: Dict) -> str:
+    async with openai_slot():
+        resp = await client.chat.completions.create(**kwargs)
+    try:
+        return resp.choices[0].message.content.strip()
+    except (IndexError, AttributeError) as e:
+        # No choices, or a null content (e.g. a refusal): the upstream reply is unusable
+        logger.error("Unexpected OpenAI response shape: %s", e)
+        raise HTTPException(502, "Unexpected response from AI service")
+
+
+async def complete_once(key: Optional[str], kwargs: Dict) -> str:
+    """Run a completion, joining an identical one already in flight for ``key``."""
+    if key is None:
+        return await _complete(kwargs)
+    task = _inflight.get(key)
+    if task is None:
+        task = _inflight[key] = asyncio.create_task(_complete(kwargs))
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # Shielded so one caller disconnecting does not cancel the call for the others
+    return await asyncio.shield(task)
+
+
+async def embed_conversation(messages: List[Dict[str, str]]) -> Optional[List[float]]:
+    """Embed everything after the system prompt for semantic cache lookups."""
+    text = "\n".join(m["content"] for m in messages[1:])
+    try:
+        async with openai_slot():
+            result = await client.embeddings.create(model=SEMCACHE_EMBED_MODEL, input=text)
+        return result.data[0].embedding
+    except Exception as e:
+        logger.warning("Semantic cache embedding failed: %s", e)
+        return None
+
+
+async def load_recent_history(session_id: str, count: int) -> List[Dict[str, str]]:
+    """Return up to the last ``count`` stored messages, ready to send to OpenAI."""
+    if redis_client is not None:
+        key, _ = _history_keys(session_id)
+        return [orjson.loads(raw) for raw in await redis_client.lrange(key, -count, -1)]
+
+    history = conversation_history.get(session_id)
+    if history is None:
+        return []
+    stored = history["messages"]
+    return list(islice(stored, max(0, len(stored) - count), None))
+
+
+async def get_cached_response(key: str) -> Optional[str]:
+    if redis_client is not None:
+        raw = await redis_client.get(f"resp:{key}")
+        return raw.decode() if raw is not None else None
+    return response_cache.get(key)
+
+
+async def store_cached_response(key: str, content: str):
+    if redis_client is not None:
+        await redis_client.set(f"resp:{key}", content, ex=RESPONSE_CACHE_TTL)
+    else:
+        response_cache[key] = content
+
+
+async def append_history(session_id: Optional[str], *messages: Dict[str, str]):
+    # Stateless (one-shot) chats keep no history, so skip timestamping and trimming entirely
+    if not session_id:
+        return
+    # Raw epoch nanoseconds; any reader formats to ISO-8601 on its own (cold) path
+    timestamp = time.time_ns()
+
+    if redis_client is not None:
+        key, ts_key = _history_keys(session_id)
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.rpush(key, *map(orjson.dumps, messages)).ltrim(key, -MAX_HISTORY_PER_SESSION, -1)
+            pipe.rpush(ts_key, *[timestamp] * len(messages)).ltrim(ts_key, -MAX_HISTORY_PER_SESSION, -1)
+            pipe.expire(key, SESSION_TTL).expire(ts_key, SESSION_TTL)
+            await pipe.execute()
+        return
+
+    history = get_session_history(session_id)
+    history["messages"].extend(messages)
+    history["timestamps"].extend([timestamp] * len(messages))
+    # Re-set the entry so an active session's TTL is refreshed on every write
+    conversation_history[session_id] = history
 
 
 # ----------------------------------------------------------------------
 # Pydantic Models
 # ----------------------------------------------------------------------
 class ChatRequest(BaseModel):
-    prompt: str
-    max_tokens: Optional[int] = None
-    temperature: Optional[float] = None
+    model_config = ConfigDict(extra="forbid", frozen=True, str_strip_whitespace=True)
+
+    prompt: str = Field(min_length=1)
+    max_tokens: Optional[int] = Field(default=None, ge=1, le=MAX_TOKENS_LIMIT)
+    temperature: Optional[float] = Field(default=None, ge=0.0, le=2.0)
+    top_p: Optional[float] = Field(default=None, ge=0.0, le=1.0)
+    frequency_penalty: Optional[float] = Field(default=None, ge=-2.0, le=2.0)
+    presence_penalty: Optional[float] = Field(default=None, ge=-2.0, le=2.0)
+    context_window: Optional[int] = Field(default=None, ge=0, le=MAX_CONTEXT_WINDOW)
     model: Optional[str] = None
     session_id: Optional[str] = None
+    system: Optional[str] = None
     stream: Optional[bool] = False
 
 
 # ----------------------------------------------------------------------
 # Routes – Root & Pages
 # ----------------------------------------------------------------------
+# Rendered once; probes and landing hits just write these bytes
+_ROOT_RESPONSE = ORJSONResponse({
+    "message": "Savrli AI API is running",
+    "endpoints": {
+        "playground": "/playground",
+        "demo": "/demo",
+        "chat": "POST /ai/chat",
+        "upload": "POST /api/resources/upload",
+        "resources_page": "/resources",
+        "health": "/health",
+    },
+    "docs": "/docs",
+})
+
+
 @app.get("/")
 async def root():
-    return {
-        "message": "Savrli AI API is running",
-        "endpoints": {
-            "playground": "/playground",
-            "demo": "/demo",
-            "chat": "POST /ai/chat",
-            "upload": "POST /api/resources/upload",
-            "resources_page": "/resources",
-            "health": "/health",
-        },
-        "docs": "/docs",
-    }
+    return _ROOT_RESPONSE
 
 
 @app.get("/playground", response_class=HTMLResponse)
-async def playground():
-    path = Path(__file__).parent.parent / "pages" / "playground.html"
-    return HTMLResponse(path.read_text(encoding="utf-8")) if path.exists() else "Playground not found"
+async def playground(request: Request):
+    return _page_response(request, _PLAYGROUND_HTML) if _PLAYGROUND_HTML is not None else "Playground not found"
 
 
 @app.get("/demo", response_class=HTMLResponse)
-async def demo():
+async def demo(request: Request):
     """Demo page for manual testing of playground and multimodal endpoints"""
-    path = Path(__file__).parent.parent / "pages" / "demo.html"
-    return HTMLResponse(path.read_text(encoding="utf-8")) if path.exists() else "Demo page not found"
+    return _page_response(request, _DEMO_HTML) if _DEMO_HTML is not None else "Demo page not found"
 
 
 @app.get("/resources", response_class=HTMLResponse)
-async def resources_page():
+async def resources_page(request: Request):
     """Static page listing uploaded / managed resources (front-end demo)."""
-    path = Path(__file__).parent.parent / "pages" / "resources.html"
-    return HTMLResponse(path.read_text(encoding="utf-8")) if path.exists() else "Resources page not found"
+    return _page_response(request, _RESOURCES_HTML) if _RESOURCES_HTML is not None else "Resources page not found"
 
 
 # ----------------------------------------------------------------------
 # Core AI Chat Endpoint
 # ----------------------------------------------------------------------
-@app.post("/ai/chat")
+# Replies are returned as ORJSONResponse directly: the payloads are plain
+# str/None dicts, so FastAPI's jsonable_encoder pass would be pure overhead
+@app.post("/ai/chat", response_model=None)
 async def chat_endpoint(request: ChatRequest):
-    if not request.prompt.strip():
-        raise HTTPException(status_code=400, detail="Prompt cannot be empty")
-
-    model = request.model or DEFAULT_MODEL
-    max_tokens = request.max_tokens or DEFAULT_MAX_TOKENS
-    temp = request.temperature or DEFAULT_TEMPERATURE
+    context_window = request.context_window if request.context_window is not None else DEFAULT_CONTEXT_WINDOW
     session_id = request.session_id
 
-    messages = [{"role": "system", "content": "You are a helpful assistant."}]
-    if session_id and session_id in conversation_history:
-        recent = conversation_history[session_id][-DEFAULT_CONTEXT_WINDOW:]
-        messages.extend([{"role": m["role"], "content": m["content"]} for m in recent])
+    user_msg = {"role": "user", "content": request.prompt}
 
-    messages.append({"role": "user", "content": request.prompt})
-
-    if session_id:
-        conversation_history[session_id].append(
-            {
-                "role": "user",
-                "content": request.prompt,
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-            }
+    # History is only written once a reply exists, so a failed call leaves no orphaned user turn
+    try:
+        recent = []
+        if session_id and context_window:
+            recent = await load_recent_history(session_id, context_window)
+        messages = [_system_msg(request.system or DEFAULT_SYSTEM_PROMPT), *recent, user_msg]
+
+        kwargs = build_openai_kwargs(
+            request.model or DEFAULT_MODEL,
+            messages,
+            request.max_tokens or DEFAULT_MAX_TOKENS,
+            request.temperature if request.temperature is not None else DEFAULT_TEMPERATURE,
+            top_p=request.top_p,
+            frequency_penalty=request.frequency_penalty,
+            presence_penalty=request.presence_penalty,
         )
-        trim_history(session_id)
 
-    try:
         if request.stream:
-            return StreamingResponse(
-                stream_response(model, messages, max_tokens, temp, session_id),
+            # Queue for the slot before answering, so a saturated server replies
+            # 429 instead of a 200 stream that fails once the queue times out
+            slot = await acquire_openai_slot()
+            return OpenAIStreamingResponse(
+                stream_response(kwargs, session_id, user_msg),
+                slot,
                 media_type="text/event-stream",
+                headers=_SSE_HEADERS,
             )
         else:
-            resp = await asyncio.to_thread(
-                client.chat.completions.create,
-                model=model,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=temp,
-            )
-            content = resp.choices[0].message.content.strip()
-
-            if session_id:
-                conversation_history[session_id].append(
-                    {
-                        "role": "assistant",
-                        "content": content,
-                        "timestamp": datetime.now(timezone.utc).isoformat(),
-                    }
-                )
-                trim_history(session_id)
-
-            return {"response": content, "session_id": session_id}
+            cache_key = response_cache_key(kwargs) if kwargs["temperature"] <= 0 else None
+            if cache_key is not None and (cached := await get_cached_response(cache_key)) is not None:
+                await append_history(session_id, user_msg, {"role": "assistant", "content": cached})
+                return ORJSONResponse({"response": cached, "session_id": session_id, "cached": True})
+
+            embedding = None
+            if semantic_cache is not None and kwargs["temperature"] <= SEMCACHE_MAX_TEMPERATURE:
+                scope = semantic_cache_scope(kwargs)
+                embedding = await embed_conversation(messages)
+                cached = semantic_cache.lookup(scope, embedding) if embedding is not None else None
+                if cached is not None:
+                    await append_history(session_id, user_msg, {"role": "assistant", "content": cached})
+                    return ORJSONResponse({"response": cached, "session_id": session_id, "cached": True})
+
+            content = await complete_once(cache_key, kwargs)
+
+            if cache_key is not None:
+                await store_cached_response(cache_key, content)
+            if embedding is not None:
+                semantic_cache.store(scope, embedding, content)
+
+            await append_history(session_id, user_msg, {"role": "assistant", "content": content})
+
+            return ORJSONResponse({"response": content, "session_id": session_id})
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"OpenAI error: {e}")
+        logger.error("Chat request failed: %s", e)
         raise HTTPException(503, "AI unavailable")
 
 
-async def stream_response(model, messages, max_tokens, temp, session_id):
-    full = ""
+def _sse_content(text: str) -> bytes:
+    return b"data: " + orjson.dumps({"content": text}) + b"\n\n"
+
+
+_STREAM_END = object()
+
+
+async def _pump_stream(stream, queue: asyncio.Queue):
+    """Move chunks from an OpenAI stream onto ``queue``, ending with _STREAM_END or the error."""
     try:
-        stream = await asyncio.to_thread(
-            client.chat.completions.create,
-            model=model,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temp,
-            stream=True,
-        )
-        for chunk in stream:
-            if delta := chunk.choices[0].delta.content:
-                full += delta
-                yield f"data: {json.dumps({'content': delta})}\n\n"
-        yield "data: {\"done\": true}\n\n"
-
-        if session_id:
-            conversation_history[session_id].append(
-                {
-                    "role": "assistant",
-                    "content": full,
-                    "timestamp": datetime.now(timezone.utc).isoformat(),
-                }
-            )
-            trim_history(session_id)
+        async for chunk in stream:
+            queue.put_nowait(chunk)
     except Exception as e:
-        yield f"data: {json.dumps({'error': str(e)})}\n\n"
+        queue.put_nowait(e)
+    else:
+        queue.put_nowait(_STREAM_END)
 
 
-# ----------------------------------------------------------------------
-# Demo: File Upload Endpoint
-# ----------------------------------------------------------------------
-@app.post("/api/resources/upload")
-async def upload_resource(file: UploadFile = File(...)):
-    """
-    Generic resource upload endpoint for testing file uploads.
-    Accepts any file and returns metadata about the uploaded file.
-    """
+async def stream_response(kwargs: Dict, session_id: Optional[str], user_msg: Dict[str, str]):
+    loop = asyncio.get_running_loop()
+    flush_after = STREAM_FLUSH_MS / 1000
+    parts = []
+    pending = 0
+    batch = 1
     try:
-        file_data = await file.read()
-        size = len(file_data)
-        size_formatted = f"{size / 1024:.2f} KB" if size > 1024 else f"{size} bytes"
-        return {
-            "success": True,
-            "message": "File uploaded successfully",
-            "file_info": {
-                "filename": file.filename,
-                "content_type": file.content_type or "application/octet-stream",
-                "size": size,
-                "size_formatted": size_formatted,
-            },
-        }
+        stream = await client.chat.completions.create(**kwargs, stream=True)
+        # One reader task per stream; queued chunks are drained without a wait
+        queue: asyncio.Queue = asyncio.Queue()
+        reader = asyncio.ensure_future(_pump_stream(stream, queue))
+        last_flush = loop.time()
+        try:
+            while True:
+                if not queue.empty():
+                    chunk = queue.get_nowait()
+                elif pending:
+                    # Held deltas go out when the flush budget runs out, even if
+                    # the model pauses before sending the next one
+                    try:
+                        chunk = await asyncio.wait_for(queue.get(), max(last_flush + flush_after - loop.time(), 0))
+                    except asyncio.TimeoutError:
+                        yield _sse_content("".join(parts[-pending:]))
+                        pending = 0
+                        batch = min(STREAM_BATCH_SIZE, int(batch * STREAM_BATCH_GROWTH))
+                        last_flush = loop.time()
+                        continue
+                else:
+                    chunk = await queue.get()
+                if chunk is _STREAM_END:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                if delta := chunk.choices[0].delta.content:
+                    parts.append(delta)
+                    pending += 1
+                    if pending >= batch or loop.time() - last_flush >= flush_after:
+                        yield _sse_content("".join(parts[-pending:]))
+                        pending = 0
+                        batch = min(STREAM_BATCH_SIZE, int(batch * STREAM_BATCH_GROWTH))
+                        last_flush = loop.time()
+        finally:
+            reader.cancel()
+        if pending:
+            yield _sse_content("".join(parts[-pending:]))
+        # Saved before the done frame, so a failed write ends the stream with the error frame instead
+        await append_history(session_id, user_msg, {"role": "assistant", "content": "".join(parts)})
+        yield _SSE_DONE
     except Exception as e:
-        logger.exception("Upload error: %s", e)
-        raise HTTPException(status_code=500, detail="File upload failed")
+        logger.error("OpenAI stream error: %s", e)
+        yield _SSE_ERROR
 
 
 # ----------------------------------------------------------------------
 # Health Check
 # ----------------------------------------------------------------------
-@app.get("/health")
+@app.get("/health", response_model=None)
 async def health():
-    return {
+    return ORJSONResponse({
         "status": "healthy",
         "model": DEFAULT_MODEL,
         "timestamp": datetime.now(timezone.utc).isoformat(),
-    }
+    })
 
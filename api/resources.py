@@ -1,5 +1,6 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from fastapi.responses import JSONResponse, FileResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import shutil
 import uuid
@@ -39,6 +40,11 @@ def list_resources():
     return index
 
 
+def _copy_to(src, dest_path: str):
+    with open(dest_path, "wb") as buffer:
+        shutil.copyfileobj(src, buffer)
+
+
 @router.post("/upload", response_model=ResourceMeta)
 async def upload_file(file: UploadFile = File(...)):
     """
@@ -50,8 +56,8 @@ async def upload_file(file: UploadFile = File(...)):
     dest_path = os.path.join(DATA_DIR, stored_name)
 
     try:
-        with open(dest_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Copy the spooled upload to disk off the event loop
+        await run_in_threadpool(_copy_to, file.file, dest_path)
     finally:
         await file.close()
 
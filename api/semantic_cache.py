@@ -0,0 +1,111 @@
+"""
+Semantic response cache for Savrli AI chat.
+
+Stores assistant replies keyed by the embedding of the conversation that
+produced them, so a later request whose embedding is close enough (cosine
+distance below a threshold) can be answered without another chat completion.
+"""
+
+from typing import List, Optional
+import time
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """
+    Fixed-capacity, in-process nearest-neighbour cache of chat replies.
+
+    Embeddings are L2-normalised on insert and kept in one preallocated
+    float32 matrix, so a lookup is a single matrix-vector product. Entries
+    are partitioned by a scope string (e.g. model + system prompt) so a reply
+    is only reused for requests made under the same settings. When full, the
+    oldest entry is overwritten.
+    """
+
+    def __init__(self, threshold: float = 0.08, max_entries: int = 1000, ttl: float = 3600.0):
+        """
+        Initialize the cache.
+
+        Args:
+            threshold: Maximum cosine distance (1 - similarity) for a hit
+            max_entries: Number of replies kept before the oldest is overwritten
+            ttl: Seconds a stored reply stays eligible for reuse
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._vectors: Optional[np.ndarray] = None
+        self._scopes = np.zeros(max_entries, dtype=np.int64)
+        self._expires = np.zeros(max_entries, dtype=np.float64)
+        self._responses: List[Optional[str]] = [None] * max_entries
+        self._next = 0
+        self._size = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None
+        return vector / norm
+
+    def lookup(self, scope: str, embedding: List[float]) -> Optional[str]:
+        """
+        Find a stored reply close enough to the given embedding.
+
+        Args:
+            scope: Partition key the reply must have been stored under
+            embedding: Embedding of the incoming conversation
+
+        Returns:
+            The cached reply, or None on a miss
+        """
+        if self._vectors is None or self._size == 0:
+            return None
+        vector = self._normalize(embedding)
+        if vector is None or vector.shape[0] != self._vectors.shape[1]:
+            return None
+
+        n = self._size
+        sims = self._vectors[:n] @ vector
+        sims[(self._scopes[:n] != hash(scope)) | (self._expires[:n] < time.monotonic())] = -np.inf
+        best = int(np.argmax(sims))
+        if 1.0 - sims[best] < self.threshold:
+            return self._responses[best]
+        return None
+
+    def store(self, scope: str, embedding: List[float], response: str) -> None:
+        """
+        Remember a reply for the given embedding.
+
+        Args:
+            scope: Partition key the reply applies to
+            embedding: Embedding of the conversation that produced the reply
+            response: Assistant reply to reuse on later hits
+        """
+        vector = self._normalize(embedding)
+        if vector is None:
+            return
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+        elif vector.shape[0] != self._vectors.shape[1]:
+            logger.warning("Semantic cache embedding size changed; entry not stored")
+            return
+
+        slot = self._next
+        self._vectors[slot] = vector
+        self._scopes[slot] = hash(scope)
+        self._expires[slot] = time.monotonic() + self.ttl
+        self._responses[slot] = response
+        self._next = (slot + 1) % self.max_entries
+        self._size = min(self._size + 1, self.max_entries)
+
+    def clear(self) -> None:
+        """Drop every cached reply."""
+        self._responses = [None] * self.max_entries
+        self._next = 0
+        self._size = 0
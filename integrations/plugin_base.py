@@ -7,6 +7,7 @@ that allows third-party integrations with productivity platforms.
 
 from abc import ABC, abstractmethod
 from typing import Dict, Any, List, Optional, Callable
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -252,3 +253,34 @@ class PluginManager:
                 "success": False,
                 "error": str(e)
             }
+    
+    async def send_message_async(self, plugin_name: str, channel: str, message: str, **kwargs) -> Dict[str, Any]:
+        """
+        Send a message via a specific plugin without blocking the event loop.
+        
+        Plugin I/O is synchronous, so the call runs in a worker thread and
+        async request handlers can keep serving other traffic meanwhile.
+        
+        Args:
+            plugin_name: Name of the plugin to use
+            channel: Target channel/location
+            message: Message to send
+            **kwargs: Additional platform-specific parameters
+            
+        Returns:
+            Dictionary with operation result
+        """
+        return await asyncio.to_thread(self.send_message, plugin_name, channel, message, **kwargs)
+    
+    async def process_webhook_async(self, plugin_name: str, webhook_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Process a webhook via a specific plugin without blocking the event loop.
+        
+        Args:
+            plugin_name: Name of the plugin to use
+            webhook_data: Webhook payload
+            
+        Returns:
+            Dictionary with processing result
+        """
+        return await asyncio.to_thread(self.process_webhook, plugin_name, webhook_data)
@@ -1,6 +1,8 @@
 import pytest
+import asyncio
+import json
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 import os
 import sys
 
@@ -15,10 +17,16 @@ from api.index import app
 client = TestClient(app)
 
 
+async def _async_stream(chunks):
+    """Mimic the AsyncStream returned by AsyncOpenAI for stream=True"""
+    for chunk in chunks:
+        yield chunk
+
+
 class TestChatRequestValidation:
     """Test validation of ChatRequest parameters"""
     
-    @patch('api.index.client.chat.completions.create')
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
     def test_basic_request(self, mock_create):
         """Test basic request still works (backwards compatibility)"""
         # Mock OpenAI response
@@ -34,15 +42,15 @@ class TestChatRequestValidation:
     def test_empty_prompt(self):
         """Test that empty prompt is rejected"""
         response = client.post("/ai/chat", json={"prompt": ""})
-        assert response.status_code == 400
-        assert "empty" in response.json()["detail"].lower()
+        assert response.status_code == 422
+        assert "prompt" in str(response.json()["detail"])
     
     def test_whitespace_only_prompt(self):
         """Test that whitespace-only prompt is rejected"""
         response = client.post("/ai/chat", json={"prompt": "   "})
-        assert response.status_code == 400
+        assert response.status_code == 422
     
-    @patch('api.index.client.chat.completions.create')
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
     def test_top_p_valid(self, mock_create):
         """Test that valid top_p value is accepted"""
         mock_response = MagicMock()
@@ -56,18 +64,18 @@ class TestChatRequestValidation:
     def test_top_p_too_high(self):
         """Test that top_p > 1.0 is rejected"""
         response = client.post("/ai/chat", json={"prompt": "Hello", "top_p": 1.5})
-        assert response.status_code == 400
-        assert "top_p" in response.json()["detail"]
+        assert response.status_code == 422
+        assert "top_p" in str(response.json()["detail"])
     
     def test_top_p_negative(self):
         """Test that negative top_p is rejected"""
         response = client.post("/ai/chat", json={"prompt": "Hello", "top_p": -0.1})
-        assert response.status_code == 400
-        assert "top_p" in response.json()["detail"]
+        assert response.status_code == 422
+        assert "top_p" in str(response.json()["detail"])
     
     def test_frequency_penalty_valid(self):
         """Test that valid frequency_penalty value is accepted"""
-        with patch('api.index.client.chat.completions.create') as mock_create:
+        with patch('api.index.client.chat.completions.create', new_callable=AsyncMock) as mock_create:
             mock_response = MagicMock()
             mock_response.choices = [MagicMock()]
             mock_response.choices[0].message.content = "Test response"
@@ -79,18 +87,18 @@ class TestChatRequestValidation:
     def test_frequency_penalty_too_high(self):
         """Test that frequency_penalty > 2.0 is rejected"""
         response = client.post("/ai/chat", json={"prompt": "Hello", "frequency_penalty": 2.5})
-        assert response.status_code == 400
-        assert "frequency_penalty" in response.json()["detail"]
+        assert response.status_code == 422
+        assert "frequency_penalty" in str(response.json()["detail"])
     
     def test_frequency_penalty_too_low(self):
         """Test that frequency_penalty < -2.0 is rejected"""
         response = client.post("/ai/chat", json={"prompt": "Hello", "frequency_penalty": -2.5})
-        assert response.status_code == 400
-        assert "frequency_penalty" in response.json()["detail"]
+        assert response.status_code == 422
+        assert "frequency_penalty" in str(response.json()["detail"])
     
     def test_presence_penalty_valid(self):
         """Test that valid presence_penalty value is accepted"""
-        with patch('api.index.client.chat.completions.create') as mock_create:
+        with patch('api.index.client.chat.completions.create', new_callable=AsyncMock) as mock_create:
             mock_response = MagicMock()
             mock_response.choices = [MagicMock()]
             mock_response.choices[0].message.content = "Test response"
@@ -102,18 +110,18 @@ class TestChatRequestValidation:
     def test_presence_penalty_too_high(self):
         """Test that presence_penalty > 2.0 is rejected"""
         response = client.post("/ai/chat", json={"prompt": "Hello", "presence_penalty": 2.5})
-        assert response.status_code == 400
-        assert "presence_penalty" in response.json()["detail"]
+        assert response.status_code == 422
+        assert "presence_penalty" in str(response.json()["detail"])
     
     def test_presence_penalty_too_low(self):
         """Test that presence_penalty < -2.0 is rejected"""
         response = client.post("/ai/chat", json={"prompt": "Hello", "presence_penalty": -2.5})
-        assert response.status_code == 400
-        assert "presence_penalty" in response.json()["detail"]
+        assert response.status_code == 422
+        assert "presence_penalty" in str(response.json()["detail"])
     
     def test_context_window_valid(self):
         """Test that valid context_window value is accepted"""
-        with patch('api.index.client.chat.completions.create') as mock_create:
+        with patch('api.index.client.chat.completions.create', new_callable=AsyncMock) as mock_create:
             mock_response = MagicMock()
             mock_response.choices = [MagicMock()]
             mock_response.choices[0].message.content = "Test response"
@@ -125,16 +133,34 @@ class TestChatRequestValidation:
     def test_context_window_too_high(self):
         """Test that context_window > 50 is rejected"""
         response = client.post("/ai/chat", json={"prompt": "Hello", "context_window": 51})
-        assert response.status_code == 400
-        assert "context_window" in response.json()["detail"]
+        assert response.status_code == 422
+        assert "context_window" in str(response.json()["detail"])
     
     def test_context_window_negative(self):
         """Test that negative context_window is rejected"""
         response = client.post("/ai/chat", json={"prompt": "Hello", "context_window": -1})
-        assert response.status_code == 400
-        assert "context_window" in response.json()["detail"]
+        assert response.status_code == 422
+        assert "context_window" in str(response.json()["detail"])
+    
+    def test_max_tokens_too_high(self):
+        """Test that max_tokens > 2000 is rejected"""
+        response = client.post("/ai/chat", json={"prompt": "Hello", "max_tokens": 2001})
+        assert response.status_code == 422
+        assert "max_tokens" in str(response.json()["detail"])
+    
+    def test_temperature_too_high(self):
+        """Test that temperature > 2.0 is rejected"""
+        response = client.post("/ai/chat", json={"prompt": "Hello", "temperature": 2.5})
+        assert response.status_code == 422
+        assert "temperature" in str(response.json()["detail"])
     
-    @patch('api.index.client.chat.completions.create')
+    def test_unknown_field_rejected(self):
+        """Test that fields outside the ChatRequest schema are rejected"""
+        response = client.post("/ai/chat", json={"prompt": "Hello", "temprature": 0.5})
+        assert response.status_code == 422
+        assert "temprature" in str(response.json()["detail"])
+    
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
     def test_custom_system_message(self, mock_create):
         """Test that custom system message is accepted"""
         mock_response = MagicMock()
@@ -152,7 +178,7 @@ class TestChatRequestValidation:
         assert messages[0]['role'] == 'system'
         assert messages[0]['content'] == custom_system
     
-    @patch('api.index.client.chat.completions.create')
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
     def test_all_advanced_parameters(self, mock_create):
         """Test request with all advanced parameters"""
         mock_response = MagicMock()
@@ -180,7 +206,7 @@ class TestChatRequestValidation:
 class TestBackwardsCompatibility:
     """Test that existing requests still work"""
     
-    @patch('api.index.client.chat.completions.create')
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
     def test_old_style_request(self, mock_create):
         """Test that old-style requests (just prompt) still work"""
         mock_response = MagicMock()
@@ -217,7 +243,7 @@ class TestHelloEndpoint:
 class TestConversationHistory:
     """Test conversation history endpoints"""
     
-    @patch('api.index.client.chat.completions.create')
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
     def test_session_creates_history(self, mock_create):
         """Test that using session_id creates conversation history"""
         mock_response = MagicMock()
@@ -249,7 +275,7 @@ class TestConversationHistory:
         assert data["session_id"] == "nonexistent-session"
         assert data["messages"] == []
     
-    @patch('api.index.client.chat.completions.create')
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
     def test_clear_history(self, mock_create):
         """Test clearing conversation history"""
         mock_response = MagicMock()
@@ -276,7 +302,7 @@ class TestConversationHistory:
         history_response = client.get("/ai/history/test-session-2")
         assert history_response.json()["messages"] == []
     
-    @patch('api.index.client.chat.completions.create')
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
     def test_history_limit_parameter(self, mock_create):
         """Test that limit parameter works for history retrieval"""
         mock_response = MagicMock()
@@ -303,7 +329,7 @@ class TestConversationHistory:
 class TestStreamingResponse:
     """Test streaming response functionality"""
     
-    @patch('api.index.client.chat.completions.create')
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
     def test_streaming_enabled(self, mock_create):
         """Test that streaming response works"""
         # Create a mock streaming response
@@ -315,7 +341,7 @@ class TestStreamingResponse:
         mock_chunk2.choices = [MagicMock()]
         mock_chunk2.choices[0].delta.content = " world"
         
-        mock_create.return_value = iter([mock_chunk1, mock_chunk2])
+        mock_create.return_value = _async_stream([mock_chunk1, mock_chunk2])
         
         response = client.post("/ai/chat", json={
             "prompt": "Test streaming",
@@ -325,13 +351,74 @@ class TestStreamingResponse:
         # Check that response is streaming
         assert response.status_code == 200
         assert response.headers["content-type"] == "text/event-stream; charset=utf-8"
+        assert response.headers["cache-control"] == "no-cache"
+        assert response.headers["x-accel-buffering"] == "no"
+        assert "content-encoding" not in response.headers
         
         # Verify streaming content
         content = response.text
         assert "data:" in content
         assert "Hello" in content or "world" in content
     
-    @patch('api.index.client.chat.completions.create')
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
+    def test_streaming_coalesces_deltas(self, mock_create):
+        """Test that deltas after the first token are batched into fewer frames"""
+        chunks = []
+        for text in "abcde":
+            chunk = MagicMock()
+            chunk.choices = [MagicMock()]
+            chunk.choices[0].delta.content = text
+            chunks.append(chunk)
+        mock_create.return_value = _async_stream(chunks)
+        
+        response = client.post("/ai/chat", json={"prompt": "Test streaming", "stream": True})
+        
+        frames = [line[len("data: "):] for line in response.text.split("\n\n") if line]
+        contents = [json.loads(f)["content"] for f in frames if "content" in f]
+        assert contents[0] == "a"
+        assert "".join(contents) == "abcde"
+        assert len(contents) < 5
+        assert json.loads(frames[-1]) == {"done": True}
+    
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
+    def test_streaming_flushes_held_delta_during_pause(self, mock_create):
+        """Test that a held delta is sent when the model pauses, not with the next delta"""
+        def make_chunk(text):
+            chunk = MagicMock()
+            chunk.choices = [MagicMock()]
+            chunk.choices[0].delta.content = text
+            return chunk
+        
+        async def paused_stream():
+            yield make_chunk("a")
+            yield make_chunk("b")
+            await asyncio.sleep(0.5)
+            yield make_chunk("c")
+        
+        mock_create.return_value = paused_stream()
+        
+        response = client.post("/ai/chat", json={"prompt": "Test streaming", "stream": True})
+        
+        frames = [line[len("data: "):] for line in response.text.split("\n\n") if line]
+        contents = [json.loads(f)["content"] for f in frames if "content" in f]
+        assert contents == ["a", "b", "c"]
+        assert json.loads(frames[-1]) == {"done": True}
+    
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
+    def test_streaming_error_frame(self, mock_create):
+        """Test that upstream stream failures end with a generic error frame"""
+        mock_create.side_effect = Exception("secret upstream detail")
+        
+        response = client.post("/ai/chat", json={
+            "prompt": "Test streaming",
+            "stream": True
+        })
+        
+        assert response.status_code == 200
+        assert 'data: {"error": "Stream failed"}' in response.text
+        assert "secret upstream detail" not in response.text
+    
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
     def test_non_streaming_default(self, mock_create):
         """Test that default behavior is non-streaming"""
         mock_response = MagicMock()
@@ -351,7 +438,7 @@ class TestStreamingResponse:
 class TestSessionManagement:
     """Test session-based conversation management"""
     
-    @patch('api.index.client.chat.completions.create')
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
     def test_conversation_context(self, mock_create):
         """Test that conversation context is maintained across requests"""
         mock_response = MagicMock()
@@ -385,7 +472,118 @@ class TestSessionManagement:
         user_messages = [m for m in messages if m['role'] == 'user']
         assert len(user_messages) >= 2
     
-    @patch('api.index.client.chat.completions.create')
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
+    def test_history_forwarded_without_timestamps(self, mock_create):
+        """Test that stored history is sent to OpenAI as plain role/content messages"""
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = "Test response"
+        mock_create.return_value = mock_response
+        
+        session_id = "payload-shape-session"
+        client.post("/ai/chat", json={"prompt": "First", "session_id": session_id})
+        client.post("/ai/chat", json={"prompt": "Second", "session_id": session_id})
+        
+        messages = mock_create.call_args_list[-1][1]['messages']
+        assert [m['content'] for m in messages[1:]] == ["First", "Test response", "Second"]
+        assert all(set(m) == {'role', 'content'} for m in messages)
+    
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
+    def test_history_capped_per_session(self, mock_create):
+        """Test that stored history never exceeds MAX_HISTORY_PER_SESSION"""
+        from api.index import conversation_history, MAX_HISTORY_PER_SESSION
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = "Test response"
+        mock_create.return_value = mock_response
+        
+        session_id = "history-cap-session"
+        for i in range(MAX_HISTORY_PER_SESSION):
+            client.post("/ai/chat", json={"prompt": f"Message {i}", "session_id": session_id})
+        
+        history = conversation_history[session_id]
+        assert len(history["messages"]) == MAX_HISTORY_PER_SESSION
+        assert len(history["timestamps"]) == MAX_HISTORY_PER_SESSION
+        assert history["messages"][-1]["content"] == "Test response"
+
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
+    def test_large_reply_gzipped(self, mock_create):
+        """Test that long JSON replies are gzip-compressed for clients that accept it"""
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = "word " * 500
+        mock_create.return_value = mock_response
+
+        for accept in ("gzip", "*"):
+            response = client.post("/ai/chat", json={"prompt": "Hello"}, headers={"Accept-Encoding": accept})
+
+            assert response.headers["content-encoding"] == "gzip", accept
+            assert response.json()["response"] == ("word " * 500).strip()
+
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
+    def test_large_reply_not_gzipped_when_refused(self, mock_create):
+        """Test that gzip;q=0 gets an uncompressed reply even though it mentions gzip"""
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = "word " * 500
+        mock_create.return_value = mock_response
+
+        response = client.post("/ai/chat", json={"prompt": "Hello"}, headers={"Accept-Encoding": "gzip;q=0"})
+
+        assert "content-encoding" not in response.headers
+        assert response.json()["response"] == ("word " * 500).strip()
+
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
+    def test_empty_completion_returns_502(self, mock_create):
+        """Test that a reply without usable content is reported as a bad gateway"""
+        mock_response = MagicMock()
+        mock_response.choices = []
+        mock_create.return_value = mock_response
+
+        response = client.post("/ai/chat", json={"prompt": "Hello"})
+
+        assert response.status_code == 502
+
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
+    def test_failed_completion_not_stored(self, mock_create):
+        """Test that a failed OpenAI call leaves no orphaned user turn in history"""
+        from api.index import conversation_history
+        mock_create.side_effect = Exception("upstream down")
+
+        session_id = "failed-completion-session"
+        response = client.post("/ai/chat", json={"prompt": "Hello", "session_id": session_id})
+
+        assert response.status_code == 503
+        assert session_id not in conversation_history
+
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
+    def test_history_store_failure_returns_503(self, mock_create):
+        """Test that a failing history store answers 503 instead of an unhandled error"""
+        redis = AsyncMock()
+        redis.lrange.side_effect = ConnectionError("redis down")
+
+        with patch('api.index.redis_client', redis):
+            response = client.post("/ai/chat", json={"prompt": "Hello", "session_id": "redis-down"})
+
+        assert response.status_code == 503
+        mock_create.assert_not_called()
+
+    @patch('api.index.append_history', new_callable=AsyncMock)
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
+    def test_stream_history_failure_not_reported_done(self, mock_create, mock_append):
+        """Test that a stream whose history write fails ends with the error frame, not done"""
+        chunk = MagicMock()
+        chunk.choices = [MagicMock()]
+        chunk.choices[0].delta.content = "Hi"
+        mock_create.return_value = _async_stream([chunk])
+        mock_append.side_effect = ConnectionError("redis down")
+
+        response = client.post("/ai/chat", json={"prompt": "Hello", "stream": True})
+
+        assert '{"done": true}' not in response.text
+        assert response.text.endswith('data: {"error": "Stream failed"}\n\n')
+
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
     def test_context_window_limits_history(self, mock_create):
         """Test that context_window parameter limits conversation history"""
         mock_response = MagicMock()
@@ -421,10 +619,201 @@ class TestSessionManagement:
         assert len(user_and_assistant_messages) <= 10  # Should be much less than all 11 messages
 
 
+class TestOpenAIBackpressure:
+    """Test concurrency limiting around OpenAI calls"""
+    
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
+    def test_saturated_returns_429(self, mock_create):
+        """Test that waiting too long for a free OpenAI slot returns 429 with Retry-After"""
+        import asyncio
+        from api.index import OpenAILimits
+        from aiolimiter import AsyncLimiter
+        limits = OpenAILimits(asyncio.Semaphore(0), AsyncLimiter(1000, 60))
+        with patch('api.index.openai_limits', return_value=limits), \
+                patch('api.index.OPENAI_QUEUE_TIMEOUT', 0.01):
+            response = client.post("/ai/chat", json={"prompt": "Hello"})
+        
+        assert response.status_code == 429
+        assert "Retry-After" in response.headers
+        mock_create.assert_not_called()
+    
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
+    def test_saturated_stream_returns_429(self, mock_create):
+        """Test that a streaming request is refused with 429 before any stream starts"""
+        import asyncio
+        from api.index import OpenAILimits
+        from aiolimiter import AsyncLimiter
+        limits = OpenAILimits(asyncio.Semaphore(0), AsyncLimiter(1000, 60))
+        with patch('api.index.openai_limits', return_value=limits), \
+                patch('api.index.OPENAI_QUEUE_TIMEOUT', 0.01):
+            response = client.post("/ai/chat", json={"prompt": "Hello", "stream": True})
+        
+        assert response.status_code == 429
+        assert "Retry-After" in response.headers
+        mock_create.assert_not_called()
+    
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
+    def test_stream_releases_slot(self, mock_create):
+        """Test that a finished stream hands its slot back"""
+        import asyncio
+        chunk = MagicMock()
+        chunk.choices = [MagicMock()]
+        chunk.choices[0].delta.content = "Hi"
+        mock_create.return_value = _async_stream([chunk])
+        from api.index import OpenAILimits
+        from aiolimiter import AsyncLimiter
+        sem = asyncio.Semaphore(1)
+        with patch('api.index.openai_limits', return_value=OpenAILimits(sem, AsyncLimiter(1000, 60))):
+            response = client.post("/ai/chat", json={"prompt": "Hello", "stream": True})
+        
+        assert response.status_code == 200
+        assert '{"done": true}' in response.text
+        assert not sem.locked()
+
+
+class TestSemanticCacheEndpoint:
+    """Test semantic cache integration in /ai/chat"""
+    
+    @patch('api.index.client.embeddings.create', new_callable=AsyncMock)
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
+    def test_near_duplicate_served_from_cache(self, mock_create, mock_embed):
+        """Test that a repeated low-temperature prompt skips the completion call"""
+        from api.semantic_cache import SemanticCache
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = "Paris"
+        mock_create.return_value = mock_response
+        mock_embedding = MagicMock()
+        mock_embedding.data = [MagicMock(embedding=[0.6, 0.8])]
+        mock_embed.return_value = mock_embedding
+        
+        with patch('api.index.semantic_cache', SemanticCache()):
+            first = client.post("/ai/chat", json={"prompt": "Capital of France?", "temperature": 0})
+            second = client.post("/ai/chat", json={"prompt": "What is the capital of France?", "temperature": 0})
+        
+        assert first.json()["response"] == "Paris"
+        assert second.json() == {"response": "Paris", "session_id": None, "cached": True}
+        assert mock_create.call_count == 1
+    
+    @patch('api.index.client.embeddings.create', new_callable=AsyncMock)
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
+    def test_different_params_not_served_from_cache(self, mock_create, mock_embed):
+        """Test that a cached reply is not reused for a request with other generation params"""
+        from api.semantic_cache import SemanticCache
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = "Madrid"
+        mock_create.return_value = mock_response
+        mock_embedding = MagicMock()
+        mock_embedding.data = [MagicMock(embedding=[0.6, 0.8])]
+        mock_embed.return_value = mock_embedding
+        
+        with patch('api.index.semantic_cache', SemanticCache()):
+            client.post("/ai/chat", json={"prompt": "Capital of Spain?", "temperature": 0})
+            for params in ({"max_tokens": 5}, {"top_p": 0.5}, {"presence_penalty": 1.0}, {"frequency_penalty": 1.0}):
+                response = client.post("/ai/chat", json={"prompt": "Capital of Spain?", "temperature": 0, **params})
+                assert "cached" not in response.json()
+            response = client.post("/ai/chat", json={"prompt": "Capital of Spain?", "temperature": 0.2})
+            assert "cached" not in response.json()
+        
+        assert mock_create.call_count == 6
+    
+    @patch('api.index.client.embeddings.create', new_callable=AsyncMock)
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
+    def test_high_temperature_bypasses_cache(self, mock_create, mock_embed):
+        """Test that sampled (high-temperature) requests never consult the cache"""
+        from api.semantic_cache import SemanticCache
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = "Test response"
+        mock_create.return_value = mock_response
+        
+        with patch('api.index.semantic_cache', SemanticCache()):
+            client.post("/ai/chat", json={"prompt": "Tell me a story", "temperature": 1.0})
+        
+        mock_embed.assert_not_called()
+
+
+class TestResponseCache:
+    """Test exact-match response caching in /ai/chat"""
+
+    def setup_method(self):
+        from api.index import response_cache
+        response_cache.clear()
+
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
+    def test_deterministic_repeat_served_from_cache(self, mock_create):
+        """Test that an identical temperature-0 request skips the completion call"""
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = "4"
+        mock_create.return_value = mock_response
+
+        first = client.post("/ai/chat", json={"prompt": "2+2?", "temperature": 0})
+        second = client.post("/ai/chat", json={"prompt": "2+2?", "temperature": 0})
+
+        assert first.json()["response"] == "4"
+        assert second.json() == {"response": "4", "session_id": None, "cached": True}
+        assert mock_create.call_count == 1
+
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
+    def test_concurrent_duplicates_share_one_call(self, mock_create):
+        """Test that identical in-flight requests collapse into one OpenAI call"""
+        from api.index import complete_once, _inflight
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = "4"
+
+        async def slow_create(**kwargs):
+            await asyncio.sleep(0.01)
+            return mock_response
+        mock_create.side_effect = slow_create
+
+        async def run():
+            return await asyncio.gather(*(complete_once("same-key", {"model": "gpt"}) for _ in range(3)))
+
+        assert asyncio.run(run()) == ["4", "4", "4"]
+        assert mock_create.call_count == 1
+        assert not _inflight
+
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
+    def test_redis_shared_cache(self, mock_create):
+        """Test that replies are read from and written to Redis when configured"""
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = "4"
+        mock_create.return_value = mock_response
+        redis = AsyncMock()
+        redis.get.return_value = None
+
+        with patch('api.index.redis_client', redis):
+            client.post("/ai/chat", json={"prompt": "2+2?", "temperature": 0})
+            key = redis.set.call_args[0][0]
+            redis.get.return_value = b"4"
+            second = client.post("/ai/chat", json={"prompt": "2+2?", "temperature": 0})
+
+        assert second.json()["cached"] is True
+        assert redis.get.call_args[0][0] == key
+        assert mock_create.call_count == 1
+
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
+    def test_sampled_requests_not_cached(self, mock_create):
+        """Test that requests with temperature above 0 always reach OpenAI"""
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = "Test response"
+        mock_create.return_value = mock_response
+
+        client.post("/ai/chat", json={"prompt": "2+2?", "temperature": 0.5})
+        client.post("/ai/chat", json={"prompt": "2+2?", "temperature": 0.5})
+
+        assert mock_create.call_count == 2
+
+
 class TestResponseSessionId:
     """Test that session_id is returned in response"""
     
-    @patch('api.index.client.chat.completions.create')
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
     def test_response_includes_session_id(self, mock_create):
         """Test that response includes session_id when provided"""
         mock_response = MagicMock()
@@ -442,7 +831,7 @@ class TestResponseSessionId:
         assert "session_id" in data
         assert data["session_id"] == "test-123"
     
-    @patch('api.index.client.chat.completions.create')
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
     def test_response_no_session_id_when_not_provided(self, mock_create):
         """Test that response handles missing session_id correctly"""
         mock_response = MagicMock()
@@ -469,6 +858,76 @@ class TestPlaygroundEndpoint:
         assert response.status_code == 200
         assert response.headers["content-type"] == "text/html; charset=utf-8"
     
+    def test_playground_is_cacheable(self):
+        """Test that the static playground page is served with a Cache-Control header"""
+        response = client.get("/playground")
+        assert response.headers["cache-control"] == "public, max-age=300"
+    
+    def test_playground_gzip_negotiated(self):
+        """Test that the playground is sent precompressed only when the client accepts gzip"""
+        gzipped = client.get("/playground", headers={"Accept-Encoding": "gzip"})
+        plain = client.get("/playground", headers={"Accept-Encoding": "identity"})
+        
+        assert gzipped.headers["content-encoding"] == "gzip"
+        assert "content-encoding" not in plain.headers
+        assert gzipped.text == plain.text
+    
+    def test_playground_gzip_q_values(self):
+        """Test that Accept-Encoding q-values decide whether gzip is used"""
+        cases = {
+            "gzip;q=0": False,
+            "gzip; q=0.0, identity": False,
+            "gzip;q=0, *": False,
+            "br, gzip;q=0.5": True,
+            "*": True,
+            "*;q=0": False,
+        }
+        for accept, expect_gzip in cases.items():
+            response = client.get("/playground", headers={"Accept-Encoding": accept})
+            assert (response.headers.get("content-encoding") == "gzip") is expect_gzip, accept
+    
+    def test_playground_etag_revalidation(self):
+        """Test that a matching If-None-Match gets a bodiless 304"""
+        etag = client.get("/playground").headers["etag"]
+        response = client.get("/playground", headers={"If-None-Match": etag})
+        
+        assert response.status_code == 304
+        assert response.content == b""
+    
+    def test_playground_etag_per_encoding(self):
+        """Test that the gzip and identity variants carry different ETags"""
+        gzipped = client.get("/playground", headers={"Accept-Encoding": "gzip"})
+        plain = client.get("/playground", headers={"Accept-Encoding": "identity"})
+        
+        assert gzipped.headers["etag"] != plain.headers["etag"]
+        revalidated = client.get("/playground", headers={
+            "Accept-Encoding": "gzip",
+            "If-None-Match": plain.headers["etag"],
+        })
+        assert revalidated.status_code == 200
+        assert revalidated.headers["content-encoding"] == "gzip"
+    
+    def test_playground_gzip_deterministic(self):
+        """Test that compressing a page twice yields identical bytes, as its strong ETag promises"""
+        from api.index import _read_page
+        with patch('gzip.time.time', return_value=1000000000.0):
+            first = _read_page("playground.html")
+        with patch('gzip.time.time', return_value=2000000000.0):
+            second = _read_page("playground.html")
+        
+        assert first.gzipped == second.gzipped
+        assert first.gzip_headers["ETag"] == second.gzip_headers["ETag"]
+    
+    def test_playground_if_none_match_forms(self):
+        """Test that weak, listed and wildcard If-None-Match values revalidate"""
+        etag = client.get("/playground").headers["etag"]
+        
+        for value in (f"W/{etag}", f'"other", {etag}', f'W/"other",W/{etag}', "*"):
+            response = client.get("/playground", headers={"If-None-Match": value})
+            assert response.status_code == 304, value
+        response = client.get("/playground", headers={"If-None-Match": '"other"'})
+        assert response.status_code == 200
+    
     def test_playground_contains_required_elements(self):
         """Test that playground HTML contains essential UI elements"""
         response = client.get("/playground")
@@ -547,7 +1006,7 @@ class TestVisionEndpoint:
         assert response.status_code == 400
         assert "max_tokens" in response.json()["detail"]
     
-    @patch('api.index.client.chat.completions.create')
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
     def test_vision_successful_request(self, mock_create):
         """Test successful vision request"""
         mock_response = MagicMock()
@@ -604,7 +1063,7 @@ class TestImageGenerationEndpoint:
         assert response.status_code == 400
         assert "quality must be" in response.json()["detail"]
     
-    @patch('api.index.client.images.generate')
+    @patch('api.index.client.images.generate', new_callable=AsyncMock)
     def test_image_gen_successful_request(self, mock_generate):
         """Test successful image generation request"""
         mock_response = MagicMock()
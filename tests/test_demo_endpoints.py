@@ -11,7 +11,7 @@ import io
 import sys
 import os
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 
 # Add parent directory to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
@@ -170,7 +170,7 @@ class TestDemoPageIntegration:
 class TestDemoEndpointsWithMocks:
     """Test endpoints with mocked OpenAI"""
 
-    @patch('api.index.client.chat.completions.create')
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
     def test_chat_api_works_for_demo(self, mock_create):
         """Test chat endpoint with mock response"""
         mock_response = MagicMock()
@@ -183,7 +183,7 @@ class TestDemoEndpointsWithMocks:
         data = response.json()
         assert data["response"] == "Mocked AI response"
 
-    @patch('api.index.client.chat.completions.create')
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
     def test_chat_endpoint_with_sample_prompts(self, mock_create):
         """Test multiple demo prompts"""
         mock_response = MagicMock()
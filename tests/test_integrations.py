@@ -2,6 +2,7 @@
 Tests for integration plugins and plugin manager.
 """
 
+import asyncio
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import MagicMock
@@ -74,6 +75,26 @@ class TestPluginBase:
         assert len(plugins) == 1
         assert plugins[0]["name"] == "test_slack"
         assert plugins[0]["enabled"] is True
+    
+    def test_send_message_async(self):
+        """Test sending a message through the async wrapper"""
+        ai_system = MagicMock()
+        manager = PluginManager(ai_system)
+        
+        config = {"bot_token": "test-token", "signing_secret": "test-secret"}
+        manager.register_plugin("test_slack", SlackPlugin(ai_system, config))
+        
+        result = asyncio.run(manager.send_message_async("test_slack", "#general", "Hello"))
+        assert result["success"] is True
+        assert result["plugin"] == "test_slack"
+    
+    def test_process_webhook_async_unknown_plugin(self):
+        """Test that the async webhook wrapper reports unknown plugins"""
+        manager = PluginManager(MagicMock())
+        
+        result = asyncio.run(manager.process_webhook_async("missing", {}))
+        assert result["success"] is False
+        assert "not found" in result["error"]
 
 
 class TestSlackPlugin:
@@ -1,6 +1,6 @@
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock, Mock
+from unittest.mock import patch, MagicMock, Mock, AsyncMock
 import os
 import sys
 import io
@@ -20,7 +20,7 @@ client = TestClient(app)
 class TestVisionEndpoint:
     """Test vision/image analysis endpoint"""
     
-    @patch('api.index.client.chat.completions.create')
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
     def test_vision_with_url(self, mock_create):
         """Test vision endpoint with image URL"""
         mock_response = MagicMock()
@@ -39,7 +39,7 @@ class TestVisionEndpoint:
         assert data["model"] == "gpt-4-vision-preview"
         assert data["input_type"] == "image"
     
-    @patch('api.index.client.chat.completions.create')
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
     def test_vision_with_base64(self, mock_create):
         """Test vision endpoint with base64 image"""
         mock_response = MagicMock()
@@ -78,7 +78,7 @@ class TestVisionEndpoint:
         assert response.status_code == 400
         assert "empty" in response.json()["detail"].lower()
     
-    @patch('api.index.client.chat.completions.create')
+    @patch('api.index.client.chat.completions.create', new_callable=AsyncMock)
     def test_vision_with_detail_level(self, mock_create):
         """Test vision endpoint with detail parameter"""
         mock_response = MagicMock()
@@ -103,7 +103,7 @@ class TestVisionEndpoint:
 class TestAudioTranscriptionEndpoint:
     """Test audio transcription endpoint"""
     
-    @patch('api.index.client.audio.transcriptions.create')
+    @patch('api.index.client.audio.transcriptions.create', new_callable=AsyncMock)
     def test_transcribe_audio(self, mock_create):
         """Test audio transcription with file upload"""
         mock_response = MagicMock()
@@ -124,7 +124,7 @@ class TestAudioTranscriptionEndpoint:
         assert data["model"] == "whisper-1"
         assert data["input_type"] == "audio"
     
-    @patch('api.index.client.audio.transcriptions.create')
+    @patch('api.index.client.audio.transcriptions.create', new_callable=AsyncMock)
     def test_transcribe_with_language(self, mock_create):
         """Test audio transcription with language parameter"""
         mock_response = MagicMock()
@@ -143,7 +143,7 @@ class TestAudioTranscriptionEndpoint:
         
         assert response.status_code == 200
     
-    @patch('api.index.client.audio.transcriptions.create')
+    @patch('api.index.client.audio.transcriptions.create', new_callable=AsyncMock)
     def test_transcribe_with_prompt(self, mock_create):
         """Test audio transcription with prompt for context"""
         mock_response = MagicMock()
@@ -166,7 +166,7 @@ class TestAudioTranscriptionEndpoint:
 class TestImageGenerationEndpoint:
     """Test image generation endpoint"""
     
-    @patch('api.index.client.images.generate')
+    @patch('api.index.client.images.generate', new_callable=AsyncMock)
     def test_generate_image_dalle3(self, mock_create):
         """Test image generation with DALL-E 3"""
         mock_response = MagicMock()
@@ -188,7 +188,7 @@ class TestImageGenerationEndpoint:
         assert data["images"][0]["url"] == "https://example.com/generated_image.png"
         assert "revised_prompt" in data["images"][0]
     
-    @patch('api.index.client.images.generate')
+    @patch('api.index.client.images.generate', new_callable=AsyncMock)
     def test_generate_image_dalle2(self, mock_create):
         """Test image generation with DALL-E 2"""
         mock_response = MagicMock()
@@ -227,7 +227,7 @@ class TestImageGenerationEndpoint:
         assert response.status_code == 400
         assert "Invalid size" in response.json()["detail"]
     
-    @patch('api.index.client.images.generate')
+    @patch('api.index.client.images.generate', new_callable=AsyncMock)
     def test_generate_image_with_quality(self, mock_create):
         """Test image generation with quality parameter"""
         mock_response = MagicMock()
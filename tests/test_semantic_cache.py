@@ -0,0 +1,70 @@
+"""
+Tests for the semantic response cache.
+"""
+
+import pytest
+from unittest.mock import patch
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from api.semantic_cache import SemanticCache
+
+
+class TestSemanticCache:
+    """Test SemanticCache lookup and storage"""
+
+    def test_empty_cache_misses(self):
+        """Test that an empty cache never hits"""
+        cache = SemanticCache()
+        assert cache.lookup("gpt", [1.0, 0.0]) is None
+
+    def test_near_duplicate_hits(self):
+        """Test that a nearly identical embedding returns the stored reply"""
+        cache = SemanticCache(threshold=0.08)
+        cache.store("gpt", [1.0, 0.0, 0.0], "Paris")
+
+        assert cache.lookup("gpt", [0.99, 0.05, 0.0]) == "Paris"
+
+    def test_distant_embedding_misses(self):
+        """Test that a dissimilar embedding is a miss"""
+        cache = SemanticCache(threshold=0.08)
+        cache.store("gpt", [1.0, 0.0, 0.0], "Paris")
+
+        assert cache.lookup("gpt", [0.0, 1.0, 0.0]) is None
+
+    def test_scope_isolation(self):
+        """Test that replies are only reused within the same scope"""
+        cache = SemanticCache()
+        cache.store("gpt-3.5-turbo", [1.0, 0.0], "Paris")
+
+        assert cache.lookup("gpt-4", [1.0, 0.0]) is None
+
+    def test_oldest_entry_overwritten_when_full(self):
+        """Test that the cache overwrites its oldest entry at capacity"""
+        cache = SemanticCache(max_entries=2)
+        cache.store("gpt", [1.0, 0.0, 0.0], "first")
+        cache.store("gpt", [0.0, 1.0, 0.0], "second")
+        cache.store("gpt", [0.0, 0.0, 1.0], "third")
+
+        assert cache.lookup("gpt", [1.0, 0.0, 0.0]) is None
+        assert cache.lookup("gpt", [0.0, 1.0, 0.0]) == "second"
+        assert cache.lookup("gpt", [0.0, 0.0, 1.0]) == "third"
+
+    def test_expired_entries_miss(self):
+        """Test that entries past their TTL are not returned"""
+        cache = SemanticCache(ttl=10)
+        with patch('api.semantic_cache.time.monotonic', return_value=100.0):
+            cache.store("gpt", [1.0, 0.0], "Paris")
+        with patch('api.semantic_cache.time.monotonic', return_value=111.0):
+            assert cache.lookup("gpt", [1.0, 0.0]) is None
+
+    def test_clear(self):
+        """Test that clear drops all entries"""
+        cache = SemanticCache()
+        cache.store("gpt", [1.0, 0.0], "Paris")
+        cache.clear()
+
+        assert cache.lookup("gpt", [1.0, 0.0]) is None